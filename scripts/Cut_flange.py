@@ -1,13 +1,19 @@
+import argparse
 import numpy as np
 import pandas as pd
 
+from mesh_predictor.Utils import read_csv_cached
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', type=int, default=1, help='number of processes running the autotuning trials.')
+args = parser.parse_args()
+
 
 doe = pd.read_csv('../data/doe.csv')
 
 # Load the data using pandas
-data = pd.read_csv('../data/cut_flange_all.csv')
-data.drop(data[data.doe_id == 1000].index, inplace=True)
-data.drop(data[data.doe_id == 247].index, inplace=True)
+data = read_csv_cached('../data/cut_flange_all.csv')
+data = data[~data.doe_id.isin([1000, 247])]
 
 from mesh_predictor import CutPredictor
 
@@ -44,7 +50,10 @@ best_config = reg.autotune(
     layers=[4, 6],
     neurons=[64, 256, 64],
     dropout=[0.0, 0.5, 0.1],
-    learning_rate=[1e-5, 1e-3]
+    learning_rate=[1e-5, 1e-3],
+    workers=args.workers,
+    storage='sqlite:///../models/tune.db',
+    study_name='flange',
 )
 print(best_config)
 
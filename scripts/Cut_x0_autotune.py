@@ -1,11 +1,17 @@
+import argparse
 import numpy as np
 import pandas as pd
 
+from mesh_predictor.Utils import read_csv_cached
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', type=int, default=1, help='number of processes running the autotuning trials.')
+args = parser.parse_args()
+
 doe = pd.read_csv('../data/doe.csv')
 
-data = pd.read_csv('../data/cut_x0_all.csv')
-data.drop(data[data.doe_id == 1000].index, inplace=True)
-data.drop(data[data.doe_id == 247].index, inplace=True)
+data = read_csv_cached('../data/cut_x0_all.csv')
+data = data[~data.doe_id.isin([1000, 247])]
 
 from mesh_predictor import CutPredictor
 
@@ -43,7 +49,10 @@ best_config = reg.autotune(
     layers=[4, 6],
     neurons=[128, 256, 64],
     dropout=[0.0, 0.0, 0.1],
-    learning_rate=[1e-5, 1e-3]
+    learning_rate=[1e-5, 1e-3],
+    workers=args.workers,
+    storage='sqlite:///../models/tune.db',
+    study_name='x0',
 )
 
 print(best_config)
\ No newline at end of file
@@ -1,10 +1,12 @@
 import numpy as np
 import pandas as pd
 
+from mesh_predictor.Utils import read_csv_cached
+
 doe_single = pd.read_csv('../data/doe.csv')
 doe_joining = pd.read_csv('../data/doe_joining.csv')
 
-data = pd.read_csv('../data/joining.csv')
+data = read_csv_cached('../data/joining.csv')
 
 
 from mesh_predictor import DoubleProjectionPredictor
@@ -2,13 +2,13 @@ import numpy as np
 import pandas as pd
 
 from mesh_predictor import MeshPredictor
+from mesh_predictor.Utils import read_csv_cached
 
 doe = pd.read_csv('../data/doe.csv')
 
 
-data = pd.read_csv('../data/zt_all_raw.csv')
-data.drop(data[data.doe_id == 1000].index, inplace=True)
-data.drop(data[data.doe_id == 247].index, inplace=True)
+data = read_csv_cached('../data/zt_all_raw.csv')
+data = data[~data.doe_id.isin([1000, 247])]
 
 
 reg = MeshPredictor()
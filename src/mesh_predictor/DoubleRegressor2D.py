@@ -2,7 +2,6 @@ import sys
 import json
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import optuna
 
 from .Predictor import Predictor
@@ -517,7 +516,8 @@ class DoubleProjectionPredictor(Predictor):
             x = np.linspace(self.min_values[self.position_attributes[0]], self.max_values[self.position_attributes[0]], shape[0])
             y = np.linspace(self.min_values[self.position_attributes[1]], self.max_values[self.position_attributes[1]], shape[1])
 
-            samples = np.array([[i, j] for i in x for j in y])
+            xx, yy = np.meshgrid(x, y, indexing='ij')
+            samples = np.stack((xx.ravel(), yy.ravel()), axis=1)
 
         elif isinstance(positions, np.ndarray):
 
@@ -535,7 +535,7 @@ class DoubleProjectionPredictor(Predictor):
         for idx, attr in enumerate(self.process_parameters_joining):
             if attr in self.categorical_attributes_joining: # numerical
                 code = one_hot([process_parameters[attr]], self.categorical_values[attr])
-                code = np.repeat(code, nb_points, axis=0)
+                code = np.broadcast_to(code, (nb_points, code.shape[1]))
                 X = np.concatenate((X, code), axis=1)
 
             else:
@@ -547,7 +547,7 @@ class DoubleProjectionPredictor(Predictor):
             for idx, attr in enumerate(self.process_parameters_single):
                 if attr in self.categorical_attributes_single: # numerical
                     code = one_hot([process_parameters[attr+suffix]], self.categorical_values[attr])
-                    code = np.repeat(code, nb_points, axis=0)
+                    code = np.broadcast_to(code, (nb_points, code.shape[1]))
                     X = np.concatenate((X, code), axis=1)
 
                 else:
@@ -597,6 +597,8 @@ class DoubleProjectionPredictor(Predictor):
 
     def _compare(self, doe_id):
 
+        import matplotlib.pyplot as plt
+
         if self.model is None:
             print("Error: no model has been trained yet.")
             return
@@ -661,6 +663,8 @@ class DoubleProjectionPredictor(Predictor):
         :param doe_id: id of the experiment.
         """
 
+        import matplotlib.pyplot as plt
+
         if self.model is None:
             print("Error: no model has been trained yet.")
             return
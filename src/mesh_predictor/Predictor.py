@@ -1,19 +1,24 @@
 from posixpath import supports_unicode_filenames
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import sklearn
 
-import ipywidgets as widgets
-
 import os
+import sys
+import shutil
+import tempfile
+import contextlib
 import pickle
 import json
+import threading
+import multiprocessing
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 import tensorflow as tf
 import optuna
 
+from .Utils import one_hot
+
 class NpEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, np.integer):
@@ -34,6 +39,35 @@ def activation_layer(activation):
     else:
         print("The activation function must be either relu, prelu or lrelu.")
 
+def tensorflow_initialized():
+    """
+    Whether the tensorflow runtime has already been started in this process.
+
+    Relies on a private attribute of tensorflow: when it is not available, the runtime is assumed to have been started.
+    """
+    from tensorflow.python.eager import context
+    ctx = context.context()
+    if not hasattr(ctx, '_initialized'):
+        print("Warning: this version of tensorflow does not tell whether its runtime has been started, it is assumed to be.")
+        return True
+    return ctx._initialized
+
+class PruningCallback(tf.keras.callbacks.Callback):
+    """
+    Reports the validation loss of each epoch to an optuna trial and stops the training if the trial should be pruned.
+    """
+
+    def __init__(self, trial):
+        super().__init__()
+        self.trial = trial
+        self.pruned = False
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.trial.report(logs['val_loss'], step=epoch)
+        if self.trial.should_prune():
+            self.pruned = True
+            self.model.stop_training = True
+
 class Predictor(object):
     """
     Base class for the predictors: Cutpredictor, ProjectionPredictor and MeshPredictor.
@@ -45,6 +79,8 @@ class Predictor(object):
 
         # Empty model
         self.model = None
+        self._predict_model = None
+        self._predict_fn = None
 
         # Not configured yet
         self.has_config = False
@@ -146,10 +182,54 @@ class Predictor(object):
                 lambda x: (x - self.min_values[attr])/(self.max_values[attr] - self.min_values[attr])
             ) 
 
+        self._make_layout()
+
+    def _make_layout(self):
+
+        # Columns occupied by each process parameter in the input matrix
+        self.col_offsets = {}
+        self._onehot_cache = {}
+        col = 0
+        for attr in self.process_parameters:
+            if attr in self.categorical_attributes:
+                width = len(self.categorical_values[attr])
+
+                # One-hot code of each categorical value
+                self._onehot_cache[attr] = {
+                    val: np.asarray(one_hot([val], self.categorical_values[attr])[0], dtype=np.float32)
+                    for val in self.categorical_values[attr]
+                }
+            else:
+                width = 1
+            self.col_offsets[attr] = (col, col + width)
+            col += width
+
+        # Position attributes are last
+        self.position_offset = col
+        self.input_width = col + len(self.position_attributes) * (2 if self.angle_input else 1)
+
+        # Normalization of the numerical process parameters
+        self._numerical_parameters = [attr for attr in self.process_parameters if not attr in self.categorical_attributes]
+        self._numerical_cols = np.array([self.col_offsets[attr][0] for attr in self._numerical_parameters], dtype=int)
+        self._mean_vec = np.array([self.mean_values[attr] for attr in self._numerical_parameters], dtype=np.float32)
+        self._std_vec = np.array([self.std_values[attr] for attr in self._numerical_parameters], dtype=np.float32)
+
+        # Normalization of the position attributes: (x - shift) / scale
+        if self.position_scaler == 'normal':
+            self._position_shift = np.array([self.mean_values[attr] for attr in self.position_attributes], dtype=np.float32)
+            self._position_scale = np.array([self.std_values[attr] for attr in self.position_attributes], dtype=np.float32)
+        else:
+            self._position_shift = np.array([self.min_values[attr] for attr in self.position_attributes], dtype=np.float32)
+            self._position_scale = np.array([self.max_values[attr] - self.min_values[attr] for attr in self.position_attributes], dtype=np.float32)
+
+        # De-normalization of the outputs: min + (max - min) * y
+        self._output_min_vec = np.array([self.min_values[attr] for attr in self.output_attributes], dtype=np.float32)
+        self._output_range_vec = np.array([self.max_values[attr] - self.min_values[attr] for attr in self.output_attributes], dtype=np.float32)
+
     def _make_arrays(self):
 
-        self.X = self.df[self.features].to_numpy()
-        self.target = self.df[self.output_attributes].to_numpy()
+        self.X = self.df[self.features].to_numpy(dtype=np.float32)
+        self.target = self.df[self.output_attributes].to_numpy(dtype=np.float32)
 
         self.number_samples = self.X.shape[0]
         self.input_shape = (self.X.shape[1], )
@@ -182,6 +262,24 @@ class Predictor(object):
         self.number_training_samples = self.X_train.shape[0]
         self.number_validation_samples = self.X_test.shape[0]
 
+    def _make_datasets(self, batch_size):
+
+        # Input pipelines preparing the next batches while the network is trained.
+        # The training set is shuffled through a permutation of the indices, each batch being gathered at once.
+        X_train = tf.constant(self.X_train)
+        y_train = tf.constant(self.y_train)
+
+        self.train_dataset = tf.data.Dataset.range(self.number_training_samples).shuffle(
+            self.number_training_samples
+        ).batch(batch_size).map(
+            lambda idx: (tf.gather(X_train, idx), tf.gather(y_train, idx)), 
+            num_parallel_calls=tf.data.AUTOTUNE
+        ).prefetch(tf.data.AUTOTUNE)
+
+        self.test_dataset = tf.data.Dataset.from_tensor_slices(
+            (self.X_test, self.y_test)
+        ).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
     def data_summary(self):
         """
         Displays a summary of the loaded data.
@@ -222,6 +320,11 @@ class Predictor(object):
 
         return self.min_values[attr] + (self.max_values[attr] - self.min_values[attr]) * y
 
+    # Rescales all outputs at once, y has the shape (N, len(output_attributes))
+    def _rescale_outputs(self, y):
+
+        return self._output_min_vec + self._output_range_vec * y
+
     #############################################################################################
     ## IO
     #############################################################################################
@@ -278,6 +381,8 @@ class Predictor(object):
         self.input_shape = config['input_shape']
         self.number_samples = config['number_samples']
 
+        self._make_layout()
+
     def save_config(self, filename):
         """
         Saves the configuration of the regressor, especially all variables derived from the data (min/max values, etc). 
@@ -417,16 +522,19 @@ class Predictor(object):
             self.input_shape = f.attrs['input_shape']
             self.number_samples = f.attrs['number_samples']
 
+            self._make_layout()
+
             self.has_config = True
 
     #############################################################################################
     ## Neural network
     #############################################################################################
 
-    def _create_model(self, config):
+    def _create_model(self, config, clear_session=True):
 
         # Clear the session
-        tf.keras.backend.clear_session()
+        if clear_session:
+            tf.keras.backend.clear_session()
      
         # Create the model
         model = tf.keras.Sequential()
@@ -453,6 +561,36 @@ class Predictor(object):
 
         return model
 
+    @contextlib.contextmanager
+    def _trial_session(self):
+
+        # Clearing the session resets the global Keras state, which must not happen while other trials are building or training their models.
+        # It is cleared whenever no trial is running. If that does not happen for a while, new trials wait for the running ones to finish, so that the memory use stays bounded.
+        with self._session_condition:
+            if self._trials_since_clear >= self._trials_per_session:
+                self._session_condition.wait_for(lambda: self._running_trials == 0)
+            if self._running_trials == 0:
+                tf.keras.backend.clear_session()
+                self._trials_since_clear = 0
+            self._running_trials += 1
+            self._trials_since_clear += 1
+
+        try:
+            yield
+        finally:
+            with self._session_condition:
+                self._running_trials -= 1
+                self._session_condition.notify_all()
+
+    def _trial_device(self, trial):
+
+        gpus = tf.config.list_logical_devices('GPU')
+
+        if self.n_jobs == 1 or len(gpus) < 2:
+            return contextlib.nullcontext()
+
+        return tf.device(gpus[trial.number % len(gpus)].name)
+
     def trial(self, trial):
 
         # Sample hyperparameters
@@ -475,42 +613,138 @@ class Predictor(object):
             'activation': self.activation,
         }
 
-        # Create the model
-        model = self._create_model(config)
+        # Parallel trials are spread over the available GPUs
+        with self._trial_session(), self._trial_device(trial):
+
+            # Create the model
+            model = self._create_model(config, clear_session=False)
+
+            # Save the network with the best validation error (one directory per trial, as trials may run in parallel)
+            checkpoint_dir = tempfile.mkdtemp(prefix="tmp_model_", dir=".")
+            checkpoint_path = os.path.join(checkpoint_dir, "weights")
+            model_checkpoint_callback = tf.keras.callbacks.ModelCheckpoint(
+                filepath=checkpoint_path,
+                save_weights_only=True,
+                monitor='val_loss',
+                mode='min',
+                save_best_only=True,
+            )
 
-        # Save the network with the best validation error
-        model_checkpoint_callback = tf.keras.callbacks.ModelCheckpoint(
-            filepath="./tmp_model",
-            save_weights_only=True,
-            monitor='val_loss',
-            mode='min',
-            save_best_only=True,
-        )
+            # Stop unpromising trials early
+            pruning_callback = PruningCallback(trial)
+
+            try:
+                # Train
+                history = model.fit(
+                    self.train_dataset, 
+                    validation_data=self.test_dataset, 
+                    epochs=self.max_epochs, 
+                    callbacks=[model_checkpoint_callback, pruning_callback],
+                    verbose=0
+                )
 
-        # Train
-        history = model.fit(
-            self.X_train, self.y_train, 
-            validation_data=(self.X_test, self.y_test), 
-            epochs=self.max_epochs, 
-            batch_size=self.batch_size, 
-            callbacks=[model_checkpoint_callback],
-            verbose=0
-        )
+                # Reload the best weights
+                if not pruning_callback.pruned:
+                    model.load_weights(checkpoint_path)
+            finally:
+                shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+            if pruning_callback.pruned:
+                raise optuna.TrialPruned()
+
+            # Check performance
+            val_mse = model.evaluate(self.test_dataset)
+
+            # Save the best network, before leaving the session as saving traces the model
+            with self._best_lock, self._worker_lock():
+                best_mse = self.best_mse
+
+                # Other worker processes may already have saved a better network
+                if self.workers > 1:
+                    record = self._read_best_record()
+                    if record is not None:
+                        best_mse = min(best_mse, record['mse'])
+
+                if val_mse < best_mse:
+                    self.best_mse = val_mse
+                    model.save(self.save_path)
+                    self.best_history = history
+                    self.best_config = config
+
+                    # Describe the saved network for the parent process
+                    if self.workers > 1:
+                        self._write_best_record({
+                            'mse': float(val_mse),
+                            'trial': trial.number,
+                            'config': config,
+                            'history': {key: [float(v) for v in val] for key, val in history.history.items()},
+                        })
 
-        # Reload the best weights
-        model.load_weights("./tmp_model")
+        return val_mse
 
-        # Check performance
-        val_mse = model.evaluate(self.X_test, self.y_test, batch_size=self.batch_size)
+    @contextlib.contextmanager
+    def _worker_lock(self):
 
-        # Save the best network
-        if val_mse < self.best_mse:
-            self.best_mse = val_mse
-            model.save(self.save_path)
-            self.best_history = history
-            self.best_config = config
+        # Serializes the comparison and saving of the best network between worker processes
+        if self.workers == 1:
+            yield
+            return
 
-        return val_mse
+        import fcntl
+        with open(self.save_path + '.lock', 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_best_record(self):
+
+        try:
+            with open(self.save_path + '.json', 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_best_record(self, record):
+
+        tmp = self.save_path + '.json.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(record, f, cls=NpEncoder)
+        os.replace(tmp, self.save_path + '.json')
+
+    def _remove_best_record(self):
+
+        for filename in (self.save_path + '.json', self.save_path + '.lock'):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _set_memory_growth(self):
+
+        # Let parallel trials share the GPU memory instead of each one reserving all of it
+        for gpu in tf.config.get_visible_devices('GPU'):
+            try:
+                tf.config.experimental.set_memory_growth(gpu, True)
+            except RuntimeError:
+                # The GPU has already been initialized
+                pass
+
+    def _autotune_worker(self, worker, trials):
+
+        # Each worker trains on a single GPU, assigned round-robin. Must happen before tensorflow is initialized in the worker.
+        gpus = tf.config.list_physical_devices('GPU')
+        if len(gpus) > 1:
+            tf.config.set_visible_devices(gpus[worker % len(gpus)], 'GPU')
+
+        self._set_memory_growth()
+        self._make_datasets(self.batch_size)
+
+        self.study = optuna.load_study(
+            study_name=self.study.study_name, 
+            storage=self._storage, 
+            pruner=self.study.pruner
+        )
+        self.study.optimize(self.trial, n_trials=trials, n_jobs=self.n_jobs)
 
     def autotune(self, 
             trials, 
@@ -520,7 +754,12 @@ class Predictor(object):
             layers=[3, 6],
             neurons=[64, 512, 32],
             dropout=[0.0, 0.5, 0.1],
-            learning_rate=[1e-6, 1e-3]
+            learning_rate=[1e-6, 1e-3],
+            n_jobs=1,
+            storage=None,
+            study_name=None,
+            pruning=True,
+            workers=1,
         ):
         """
         Searches for the optimal network configuration for the data.
@@ -533,6 +772,11 @@ class Predictor(object):
         :param neurons: range (and optionally step) for the number of neurons per layer (default: [64, 512, 32]). If only two values are provided, the step is assumed to be 1.
         :param dropout: range and step for the dropout level (default: [0.0, 0.5, 0.1]).
         :param learning_rate: range for the learning rate (default: [1e-6, 1e-3]). The values will be sampled log-uniformly.
+        :param n_jobs: number of trials evaluated in parallel (default: 1). -1 uses all CPU cores. On a multi-GPU system, the trials are distributed round-robin over the GPUs (over the GPU of each worker when `workers` is greater than 1). The Keras session can only be cleared when no trial is running: after 10 * `n_jobs` trials without such an occasion, new trials wait for the running ones to finish.
+        :param storage: optuna storage URL used to record the study, e.g. 'sqlite:///tune.db' (default: None, the study is kept in memory).
+        :param study_name: name of the study in the storage. An existing study with the same name is resumed (default: None).
+        :param pruning: whether trials whose validation loss is worse than the median of the previous trials at the same epoch are stopped early (default: True).
+        :param workers: number of processes sharing the trials, each of them evaluating `n_jobs` trials at a time (default: 1). On a multi-GPU system, each worker is assigned one GPU round-robin. Requires `storage`, through which the processes coordinate. The workers are forked from the current process, which is only available on Linux and before tensorflow has been used in the current process (i.e. not after `custom_model()`, `load_network()`, `predict()` or a previous call to `autotune()`).
 
         """
 
@@ -540,10 +784,27 @@ class Predictor(object):
             print("Error: The data has not been loaded yet.")
             return
 
+        if workers > 1:
+            if storage is None:
+                print("Error: a storage must be provided to distribute the trials over several workers.")
+                return None
+
+            if not sys.platform.startswith('linux'):
+                print("Error: distributing the trials over several workers is only available on Linux.")
+                return None
+
+            # Forking a process where the tensorflow runtime is running can deadlock or crash the workers
+            if tensorflow_initialized():
+                print("Error: tensorflow has already been used in this process, the trials can not be distributed over several workers. Call autotune() in a fresh process.")
+                return None
+
         # Save arguments
         self.save_path = save_path
         self.batch_size = batch_size
         self.max_epochs = max_epochs
+        self.n_jobs = n_jobs
+        self.workers = workers
+        self._storage = storage
         self.range_layers = layers
         self.range_neurons = neurons
         if len(self.range_neurons) == 2:
@@ -555,14 +816,71 @@ class Predictor(object):
         # Keep the best network only
         self.best_mse = 10000000.0
         self.best_history = None
+        self._best_lock = threading.Lock()
+
+        # Trials currently building or training a model
+        self._session_condition = threading.Condition()
+        self._running_trials = 0
+        self._trials_since_clear = 0
+        self._trials_per_session = 10 * (n_jobs if n_jobs > 0 else os.cpu_count())
 
         # Start the study
-        self.study = optuna.create_study(direction='minimize')
-        self.study.optimize(self.trial, n_trials=trials)
+        self.study = optuna.create_study(
+            direction='minimize', 
+            storage=storage, 
+            study_name=study_name, 
+            load_if_exists=True,
+            pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=5) if pruning else optuna.pruners.NopPruner(),
+        )
+
+        if workers == 1:
+
+            if n_jobs != 1:
+                self._set_memory_growth()
+
+            self._make_datasets(self.batch_size)
+            self.study.optimize(self.trial, n_trials=trials, n_jobs=n_jobs)
+
+        else:
+
+            # Only networks trained in this run are compared, as with a single process
+            self._remove_best_record()
+
+            # tensorflow has not been initialized in this process, it is safe to fork
+            context = multiprocessing.get_context('fork')
+            processes = [
+                context.Process(target=self._autotune_worker, args=(n, trials // workers + (1 if n < trials % workers else 0)))
+                for n in range(workers)
+            ]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+
+            # A crashed worker did not complete its share of the trials
+            failed = [n for n, p in enumerate(processes) if p.exitcode != 0]
+            if len(failed) > 0:
+                self._remove_best_record()
+                print("Error: the workers", failed, "did not complete their trials (exit codes:", [processes[n].exitcode for n in failed], ").")
+                return None
+
+            # Retrieve the network saved by the workers
+            self.study = optuna.load_study(study_name=self.study.study_name, storage=storage)
+            record = self._read_best_record()
+            self._remove_best_record()
+            if record is not None:
+                self.best_mse = record['mse']
+                self.best_config = record['config']
+                self.best_history = tf.keras.callbacks.History()
+                self.best_history.history = record['history']
 
         if self.best_history is None:
             print("Error: could not find a correct configuration")
             return None
+
+        if not os.path.isdir(self.save_path):
+            print("Error: the best network was not saved in", self.save_path)
+            return None
         
         # Reload the best model
         self.model = tf.keras.models.load_model(self.save_path)
@@ -621,6 +939,7 @@ class Predictor(object):
         self.save_path = save_path
         self.best_config = config
         self.batch_size = config['batch_size']
+        self._make_datasets(self.batch_size)
 
         # Create the model
         self.model = self._create_model(self.best_config)
@@ -638,10 +957,9 @@ class Predictor(object):
 
         # Train
         history = self.model.fit(
-            self.X_train, self.y_train, 
-            validation_data=(self.X_test, self.y_test), 
+            self.train_dataset, 
+            validation_data=self.test_dataset, 
             epochs=config['max_epochs'], 
-            batch_size=self.batch_size, 
             callbacks=[model_checkpoint_callback],
             verbose=1 if verbose else 0
         )
@@ -650,7 +968,7 @@ class Predictor(object):
         self.model.load_weights("./tmp_model")
 
         # Check performance
-        val_mse = self.model.evaluate(self.X_test, self.y_test, batch_size=self.batch_size)
+        val_mse = self.model.evaluate(self.test_dataset)
 
         # Save the best network
         self.best_mse = val_mse
@@ -669,6 +987,8 @@ class Predictor(object):
         You need to finally call `plt.show()` if you are in a script.
         """
 
+        import matplotlib.pyplot as plt
+
         if not self.has_config:
             print("Error: The data has not been loaded yet.")
             return
@@ -705,6 +1025,36 @@ class Predictor(object):
     ## Inference
     #############################################################################################
 
+    def _predict_raw(self, X):
+
+        # Compiled inference function, rebuilt whenever the model changes
+        if self._predict_model is not self.model:
+            model = self.model
+            self._predict_fn = tf.function(
+                lambda x: model(x, training=False),
+                input_signature=[tf.TensorSpec((None, model.input_shape[-1]), tf.float32)],
+                jit_compile=True,
+            )
+            self._predict_model = model
+
+        # Batches are contiguous float32 views of the inputs, which tensorflow can wrap without copy when they are suitably aligned
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        batch_size = int(self.batch_size)
+
+        y = []
+        for i in range(0, X.shape[0], batch_size):
+            batch = X[i:i+batch_size]
+            n = batch.shape[0]
+
+            # The last batch is padded to the next power of two (at most the batch size), so that XLA compiles the function for a few shapes only
+            if n < batch_size:
+                padded = min(batch_size, 1 << (n - 1).bit_length())
+                batch = np.concatenate((batch, np.zeros((padded - n, X.shape[1]), dtype=np.float32)), axis=0)
+
+            y.append(self._predict_fn(tf.convert_to_tensor(batch)).numpy()[:n])
+
+        return np.concatenate(y, axis=0)
+
     def compare(self, doe_id):
         """
         Compares the prediction and the ground truth for the specified experiment.
@@ -1,9 +1,7 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from .Predictor import Predictor
-from .Utils import one_hot
 
 class CutPredictor(Predictor):
     """
@@ -91,50 +89,32 @@ class CutPredictor(Predictor):
         attr = self.position_attributes[0]
         samples = np.linspace(self.min_values[attr], self.max_values[attr], positions)
 
-        X = np.empty((positions, 0))
+        X = np.empty((positions, self.input_width), dtype=np.float32)
 
-        for idx, attr in enumerate(self.process_parameters):
+        # Numerical process parameters
+        values = np.array([process_parameters[attr] for attr in self._numerical_parameters], dtype=np.float32)
+        X[:, self._numerical_cols] = (values - self._mean_vec) / self._std_vec
 
-            if attr in self.categorical_attributes:
-                
-                code = one_hot([process_parameters[attr]], self.categorical_values[attr])
-                code = np.repeat(code, positions, axis=0)
-                
-                X = np.concatenate((X, code), axis=1)
+        # Categorical process parameters
+        for attr, codes in self._onehot_cache.items():
 
-            else:
-
-                val = ((process_parameters[attr] - self.mean_values[attr] ) / self.std_values[attr]) * np.ones((positions, 1))
-
-                X = np.concatenate((X, val ), axis=1)
+            start, stop = self.col_offsets[attr]
+            X[:, start:stop] = codes[process_parameters[attr]]
 
         # Position attribute is last
-        for attr in self.position_attributes:
-
-            if not self.angle_input:
+        if not self.angle_input:
 
-                if self.position_scaler == 'normal':
-                    values = (samples.reshape((positions, 1)) - self.mean_values[attr] ) / self.std_values[attr]
-                else:
-                    values = (samples.reshape((positions, 1)) - self.min_values[attr] ) / (self.max_values[attr] - self.min_values[attr])
+            X[:, self.position_offset:] = (samples.reshape((positions, 1)) - self._position_shift) / self._position_scale
 
-                X = np.concatenate((X, values), axis=1)
+        else:
 
-            else:
+            # (cos, sin) pair for each position attribute
+            cossin = np.column_stack((np.cos(samples), np.sin(samples)))
+            X[:, self.position_offset:] = np.tile(cossin, len(self.position_attributes))
 
-                X = np.concatenate(
-                    (X, np.cos(samples).reshape((positions, 1)) ), 
-                    axis=1
-                )
-                X = np.concatenate(
-                    (X, np.sin(samples).reshape((positions, 1)) ), 
-                    axis=1
-                )
+        y = self._predict_raw(X).reshape((positions, len(self.output_attributes)))
 
-        y = self.model.predict(X, batch_size=self.batch_size).reshape((positions, len(self.output_attributes)))
-
-        for idx, attr in enumerate(self.output_attributes):
-            y[:, idx] = self._rescale_output(attr, y[:, idx])
+        y = self._rescale_outputs(y)
 
         # Return inputs and outputs
         if as_df:
@@ -151,6 +131,8 @@ class CutPredictor(Predictor):
 
     def _compare(self, doe_id):
 
+        import matplotlib.pyplot as plt
+
         if self.model is None:
             print("Error: no model has been trained yet.")
             return
@@ -163,20 +145,15 @@ class CutPredictor(Predictor):
         t = self.target[self.doe_id_list == doe_id, :]
         N, _ = t.shape
         
-        for idx, attr in enumerate(self.output_attributes):
-            t[:, idx] = self._rescale_output(attr, t[:, idx])
+        t = self._rescale_outputs(t)
 
 
-        for i, attr in enumerate(self.position_attributes):
-            if self.position_scaler == 'normal':
-                position = self.mean_values[attr] + X[:, -1] * self.std_values[attr]
-            else:
-                position = self.min_values[attr] +  X[:, -1] * (self.max_values[attr] - self.min_values[attr])
+        # The last input column holds the last position attribute
+        position = self._position_shift[-1] + X[:, -1] * self._position_scale[-1]
 
-        y = self.model.predict(X, batch_size=self.batch_size)
+        y = self._predict_raw(X)
 
-        for idx, attr in enumerate(self.output_attributes):
-            y[:, idx] = self._rescale_output(attr, y[:, idx])
+        y = self._rescale_outputs(y)
 
         for idx, attr in enumerate(self.output_attributes):
             plt.figure()
@@ -1,10 +1,8 @@
 import sys
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from .Predictor import Predictor
-from .Utils import one_hot
 
 class ProjectionPredictor(Predictor):
     """
@@ -103,10 +101,11 @@ class ProjectionPredictor(Predictor):
             shape = positions
             nb_points = shape[0] * shape[1]
 
-            x = np.linspace(self.min_values[self.position_attributes[0]], self.max_values[self.position_attributes[0]], shape[0])
-            y = np.linspace(self.min_values[self.position_attributes[1]], self.max_values[self.position_attributes[1]], shape[1])
+            x = np.linspace(self.min_values[self.position_attributes[0]], self.max_values[self.position_attributes[0]], shape[0], dtype=np.float32)
+            y = np.linspace(self.min_values[self.position_attributes[1]], self.max_values[self.position_attributes[1]], shape[1], dtype=np.float32)
 
-            samples = np.array([[i, j] for i in x for j in y])
+            xx, yy = np.meshgrid(x, y, indexing='ij')
+            samples = np.stack((xx.ravel(), yy.ravel()), axis=1)
 
         elif isinstance(positions, np.ndarray):
 
@@ -115,40 +114,28 @@ class ProjectionPredictor(Predictor):
             if d != 2:
                 print("ERROR: the positions must have the shape (N, 2).")
                 return
-            samples = positions
+            samples = positions.astype(np.float32)
 
 
         # Process parameters
-        X = np.empty((nb_points, 0))
-        for idx, attr in enumerate(self.process_parameters):
+        X = np.empty((nb_points, self.input_width), dtype=np.float32)
 
-            if attr in self.categorical_attributes:
-                
-                code = one_hot([process_parameters[attr]], self.categorical_values[attr])
-                code = np.repeat(code, nb_points, axis=0)
-                
-                X = np.concatenate((X, code), axis=1)
+        # Numerical process parameters
+        values = np.array([process_parameters[attr] for attr in self._numerical_parameters], dtype=np.float32)
+        X[:, self._numerical_cols] = (values - self._mean_vec) / self._std_vec
 
-            else:
+        # Categorical process parameters
+        for attr, codes in self._onehot_cache.items():
 
-                val = ((process_parameters[attr] - self.mean_values[attr] ) / self.std_values[attr]) * np.ones((nb_points, 1))
-
-                X = np.concatenate((X, val ), axis=1)
+            start, stop = self.col_offsets[attr]
+            X[:, start:stop] = codes[process_parameters[attr]]
 
         # Position attributes are last
-        for i, attr in enumerate(self.position_attributes):
-            if self.position_scaler == 'normal':
-                values = (samples[:, i] - self.mean_values[attr] ) / self.std_values[attr]
-            else:
-                values = (samples[:, i] - self.min_values[attr] ) / (self.max_values[attr] - self.min_values[attr])
-            
-            X = np.concatenate((X, values.reshape((nb_points, 1))), axis=1)
+        X[:, self.position_offset:] = (samples - self._position_shift) / self._position_scale
 
         # Predict outputs and de-normalize
-        y = self.model.predict(X, batch_size=self.batch_size).reshape((nb_points, len(self.output_attributes)))
-        result = []
-        for idx, attr in enumerate(self.output_attributes):
-            result.append(self._rescale_output(attr, y[:, idx]).reshape(shape))
+        y = self._predict_raw(X).reshape((nb_points, len(self.output_attributes)))
+        result = self._rescale_outputs(y).T.reshape((len(self.output_attributes),) + shape)
 
         # Return inputs and outputs
         if as_df:
@@ -160,11 +147,13 @@ class ProjectionPredictor(Predictor):
             return d
 
         else:
-            return samples, np.array(result)
+            return samples, result
 
 
     def _compare(self, doe_id):
 
+        import matplotlib.pyplot as plt
+
         if self.model is None:
             print("Error: no model has been trained yet.")
             return
@@ -176,23 +165,14 @@ class ProjectionPredictor(Predictor):
         X = self.X[self.doe_id_list == doe_id, :]
         t = self.target[self.doe_id_list == doe_id, :]
         N, _ = t.shape
-        for idx, attr in enumerate(self.output_attributes):
-            t[:, idx] = self._rescale_output(attr, t[:, idx])
+        t = self._rescale_outputs(t)
 
-        positions = []
-        for i, attr in enumerate(self.position_attributes):
-            if self.position_scaler == 'normal':
-                values = self.mean_values[attr] + X[:, i-2] * self.std_values[attr]
-            else:
-                values = self.min_values[attr] +  X[:, i-2] * (self.max_values[attr] - self.min_values[attr])
-            positions.append(values)
-        positions=np.array(positions)
+        positions = (self._position_shift + X[:, -2:] * self._position_scale).T
 
-        y = self.model.predict(X, batch_size=self.batch_size)
+        y = self._predict_raw(X)
 
 
-        for idx, attr in enumerate(self.output_attributes):
-            y[:, idx] = self._rescale_output(attr, y[:, idx])
+        y = self._rescale_outputs(y)
 
         import matplotlib.tri as tri
         triang = tri.Triangulation(X[:, -2], X[:, -1])
@@ -221,6 +201,8 @@ class ProjectionPredictor(Predictor):
         :param doe_id: id of the experiment.
         """
 
+        import matplotlib.pyplot as plt
+
         if self.model is None:
             print("Error: no model has been trained yet.")
             return
@@ -233,22 +215,13 @@ class ProjectionPredictor(Predictor):
         t = self.target[self.doe_id_list == doe_id, :]
         N, _ = t.shape
         
-        for idx, attr in enumerate(self.output_attributes):
-            t[:, idx] = self._rescale_output(attr, t[:, idx])
+        t = self._rescale_outputs(t)
 
-        positions = []
-        for i, attr in enumerate(self.position_attributes):
-            if self.position_scaler == 'normal':
-                values = self.mean_values[attr] + X[:, i-2] * self.std_values[attr]
-            else:
-                values = self.min_values[attr] +  X[:, i-2] * (self.max_values[attr] - self.min_values[attr])
-            positions.append(values)
-        positions=np.array(positions)
+        positions = (self._position_shift + X[:, -2:] * self._position_scale).T
 
-        y = self.model.predict(X, batch_size=self.batch_size)
+        y = self._predict_raw(X)
 
-        for idx, attr in enumerate(self.output_attributes):
-            y[:, idx] = self._rescale_output(attr, y[:, idx])
+        y = self._rescale_outputs(y)
 
 
         fig = plt.figure()
@@ -1,10 +1,8 @@
 import sys
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from .Predictor import Predictor
-from .Utils import one_hot
 
 class MeshPredictor(Predictor):
     """
@@ -86,40 +84,25 @@ class MeshPredictor(Predictor):
 
         nb_points, _ = positions.shape
 
-        X = np.empty((nb_points, 0))
+        X = np.empty((nb_points, self.input_width), dtype=np.float32)
 
-        for idx, attr in enumerate(self.process_parameters):
+        # Numerical process parameters
+        values = np.array([process_parameters[attr] for attr in self._numerical_parameters], dtype=np.float32)
+        X[:, self._numerical_cols] = (values - self._mean_vec) / self._std_vec
 
-            if attr in self.categorical_attributes:
-                
-                code = one_hot([process_parameters[attr]], self.categorical_values[attr])
-                code = np.repeat(code, nb_points, axis=0)
-                
-                X = np.concatenate((X, code), axis=1)
+        # Categorical process parameters
+        for attr, codes in self._onehot_cache.items():
 
-            else:
-
-                val = ((process_parameters[attr] - self.mean_values[attr] ) / self.std_values[attr]) * np.ones((nb_points, 1))
-
-                X = np.concatenate((X, val ), axis=1)
+            start, stop = self.col_offsets[attr]
+            X[:, start:stop] = codes[process_parameters[attr]]
 
         # Position attributes are last
-        for i, attr in enumerate(self.position_attributes):
-            
-            if self.position_scaler == 'normal':
-                values = (positions[:, i] - self.mean_values[attr] ) / self.std_values[attr]
-            else:
-                values = (positions[:, i] - self.min_values[attr] ) / (self.max_values[attr] - self.min_values[attr])
-                
-            X = np.concatenate((X, values.reshape((nb_points, 1))), axis=1)
+        X[:, self.position_offset:] = (positions - self._position_shift) / self._position_scale
 
+        y = self._predict_raw(X)
 
-        y = self.model.predict(X, batch_size=self.batch_size)
 
-
-        for idx, attr in enumerate(self.output_attributes):
-            
-            y[:, idx] = self._rescale_output(attr, y[:, idx])
+        y = self._rescale_outputs(y)
 
         # Return inputs and outputs
         if as_df:
@@ -136,6 +119,8 @@ class MeshPredictor(Predictor):
 
     def _compare(self, doe_id):
 
+        import matplotlib.pyplot as plt
+
         if self.model is None:
             print("Error: no model has been trained yet.")
             return
@@ -148,24 +133,15 @@ class MeshPredictor(Predictor):
         t = self.target[self.doe_id_list == doe_id, :]
         N, _ = t.shape
         
-        for idx, attr in enumerate(self.output_attributes):
-            t[:, idx] = self._rescale_output(attr, t[:, idx])
+        t = self._rescale_outputs(t)
 
-        positions = []
-        for i, attr in enumerate(self.position_attributes):
-            if self.position_scaler == 'normal':
-                values = self.mean_values[attr] + X[:, i-3] * self.std_values[attr]
-            else:
-                values = self.min_values[attr] +  X[:, i-3] * (self.max_values[attr] - self.min_values[attr])
-            positions.append(values)
-        positions=np.array(positions)
+        positions = (self._position_shift + X[:, -3:] * self._position_scale).T
 
 
-        y = self.model.predict(X, batch_size=self.batch_size)
+        y = self._predict_raw(X)
 
 
-        for idx, attr in enumerate(self.output_attributes):
-            y[:, idx] = self._rescale_output(attr, y[:, idx])
+        y = self._rescale_outputs(y)
 
 
         for idx, attr in enumerate(self.output_attributes):
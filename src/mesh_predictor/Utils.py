@@ -1,4 +1,6 @@
+import os
 import numpy as np
+import pandas as pd
 
 def one_hot(data, values):
     "Utility to create a one-hot matrix."
@@ -13,4 +15,36 @@ def one_hot(data, values):
         idx = list(values).index(val)
         res[i, idx] = 1.0
 
-    return res
\ No newline at end of file
+    return res
+
+def read_csv_cached(filename):
+    """
+    Reads a csv file with pandas and caches it as a feather file next to it (`filename + '.feather'`).
+
+    The cached file is used as long as it is more recent than the csv file. Requires pyarrow and a writable directory, otherwise the csv file is read every time.
+
+    :param filename: path to the csv file.
+    """
+
+    cached = filename + '.feather'
+
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(filename):
+        return pd.read_feather(cached)
+
+    df = pd.read_csv(filename)
+
+    # Write to a temporary file first, so that an interrupted or concurrent write never leaves a truncated cache behind
+    tmp = cached + '.' + str(os.getpid()) + '.tmp'
+    try:
+        df.to_feather(tmp)
+        os.replace(tmp, cached)
+    except ImportError:
+        print("Warning: pyarrow is not installed, the csv file can not be cached.")
+    except (OSError, TypeError, ValueError) as e:
+        # pyarrow can not store object columns of mixed types
+        print("Warning: the csv file can not be cached:", e)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    return df